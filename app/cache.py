@@ -0,0 +1,134 @@
+import os
+import time
+from typing import Any, NamedTuple, Optional, Tuple
+import orjson
+from cachetools import TLRUCache
+from dotenv import load_dotenv
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+load_dotenv()
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+# In-process tier in front of Redis for the hottest keys.
+L1_MAXSIZE = int(os.getenv("CACHE_L1_MAXSIZE", "1024"))
+L1_TTL = int(os.getenv("CACHE_L1_TTL", "3600"))
+
+# Bump the version whenever the stored value format changes, so entries
+# written by older deployments are never read back in the wrong shape.
+CACHE_PREFIX = "fmp:v2"
+
+# How long a last-known value is kept around to answer when FMP fails.
+STALE_TTL = int(os.getenv("CACHE_STALE_TTL", str(7 * 24 * 3600)))
+
+class CacheEntry(NamedTuple):
+    """
+    A cached value and its freshness windows (epoch seconds).
+
+    Before `fresh_until` the value is served as is. Until `stale_until` it
+    is still served, but the caller should refresh it in the background.
+    After that it is only good as a fallback when FMP is failing.
+    """
+
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+def _local_expiry(_key: str, item: Tuple[float, CacheEntry], now: float) -> float:
+    return now + item[0]
+
+class ResponseCache:
+    """
+    Best-effort two-tier cache for decoded FMP responses.
+
+    Lookups hit a small in-process LRU first, then Redis. Values in the
+    local tier are handed out as shared objects without copying, so
+    callers must treat them as read-only.
+
+    Redis keeps each entry for at least STALE_TTL, well past its
+    freshness windows, so the client can fall back to the last good answer
+    on upstream errors. The local tier drops entries once they are no
+    longer servable without an error.
+
+    Without a Redis connection only the local tier is used. Redis errors
+    are swallowed so an unavailable cache never fails a request.
+    """
+
+    def __init__(
+        self,
+        redis: Optional[Redis] = None,
+        prefix: str = CACHE_PREFIX,
+        l1_maxsize: int = L1_MAXSIZE,
+        l1_ttl: int = L1_TTL,
+    ) -> None:
+        self._redis = redis
+        self.prefix = prefix
+        self._local: TLRUCache = TLRUCache(maxsize=l1_maxsize, ttu=_local_expiry)
+        self._l1_ttl = l1_ttl
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _remember(self, full_key: str, entry: CacheEntry) -> None:
+        lifetime = min(self._l1_ttl, entry.stale_until - time.time())
+        if lifetime > 0:
+            self._local[full_key] = (lifetime, entry)
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        """Entry for `key` whatever its freshness, or None on a miss."""
+        full_key = self._key(key)
+        item = self._local.get(full_key)
+        if item is not None:
+            return item[1]
+
+        if self._redis is None:
+            return None
+        try:
+            raw = await self._redis.get(full_key)
+        except RedisError:
+            return None
+        if raw is None:
+            return None
+
+        try:
+            value, fresh_until, stale_until = orjson.loads(raw)
+            entry = CacheEntry(value, float(fresh_until), float(stale_until))
+        except (ValueError, TypeError):
+            # Unreadable or foreign value under our prefix: treat as a miss.
+            return None
+        self._remember(full_key, entry)
+        return entry
+
+    async def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: int,
+        stale_while_revalidate: Optional[int] = None,
+    ) -> None:
+        """
+        Store `value` as fresh for `ttl` seconds, then servable while being
+        refreshed for `stale_while_revalidate` more (defaults to `ttl`).
+        """
+        if stale_while_revalidate is None:
+            stale_while_revalidate = ttl
+        now = time.time()
+        entry = CacheEntry(value, now + ttl, now + ttl + stale_while_revalidate)
+
+        full_key = self._key(key)
+        self._remember(full_key, entry)
+        if self._redis is None:
+            return
+        try:
+            await self._redis.set(
+                full_key,
+                orjson.dumps(tuple(entry)),
+                ex=max(ttl + stale_while_revalidate, STALE_TTL),
+            )
+        except RedisError:
+            pass
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
@@ -1,54 +1,249 @@
+import asyncio
 import os
-from typing import Any, Dict, List, Optional
-import requests
+import time
+from typing import Any, Dict, List, Optional, Sequence
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
+from tenacity import (
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential_jitter,
+)
+from app.cache import ResponseCache
 
 load_dotenv()
 
 FMP_API_KEY = os.getenv("FMP_API_KEY")
 FMP_BASE_URL = os.getenv("FMP_BASE_URL", "https://financialmodelingprep.com/stable")
+# Outbound ceiling: calls per minute allowed by the FMP plan, and how many
+# may be in flight at once.
+FMP_RATE_LIMIT = int(os.getenv("FMP_RATE_LIMIT", "300"))
+FMP_MAX_CONCURRENCY = int(os.getenv("FMP_MAX_CONCURRENCY", "20"))
+# Ask FMP for only the projected columns via a `fields=` query param. The
+# stable API doesn't document it, so it is opt-in; rows are trimmed
+# client-side either way, so an ignored param only costs bandwidth.
+FMP_FIELDS_PUSHDOWN = os.getenv("FMP_FIELDS_PUSHDOWN", "false").lower() in ("1", "true", "yes")
 
 if not FMP_API_KEY:
     raise RuntimeError(
         "FMP_API_KEY is not set. Please configure it in your environment or .env file."
     )
 
+# Cache lifetime per endpoint, in seconds. Search results move quickly;
+# fundamentals only change when a new filing lands.
+CACHE_TTL_SHORT = 60
+CACHE_TTL_NORMAL = 60 * 60
+CACHE_TTL_LONG = 24 * 60 * 60
+
+CACHE_TTL: Dict[str, int] = {
+    "search-symbol": CACHE_TTL_SHORT,
+    "profile": CACHE_TTL_NORMAL,
+    "income-statement": CACHE_TTL_LONG,
+    "balance-sheet-statement": CACHE_TTL_LONG,
+    "cash-flow-statement": CACHE_TTL_LONG,
+}
+
+ENDPOINTS = (
+    "search-symbol",
+    "profile",
+    "income-statement",
+    "balance-sheet-statement",
+    "cash-flow-statement",
+)
+
+# Outbound pool to FMP. With HTTP/2 most concurrent requests multiplex
+# over a few connections, so keep them warm between bursts.
+HTTP_LIMITS = httpx.Limits(
+    max_connections=100,
+    max_keepalive_connections=50,
+    keepalive_expiry=30,
+)
+
+# Fail fast when FMP can't be reached, but give large statement bodies
+# time to arrive.
+HTTP_TIMEOUT = httpx.Timeout(connect=2, read=8, write=2, pool=2)
+
+def create_http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+
+# Upstream statuses worth another attempt; anything else non-2xx is final.
+RETRYABLE_STATUS = frozenset({429, 502, 503, 504})
+
+_retry_transient = retry(
+    retry=retry_if_exception_type((httpx.HTTPStatusError, httpx.TransportError)),
+    wait=wait_exponential_jitter(initial=0.1, max=2),
+    stop=stop_after_attempt(3),
+    reraise=True,
+)
+
+def _raise_for_status(resp: httpx.Response) -> None:
+    if resp.is_success:
+        return
+    message = f"{resp.status_code} {resp.text[:200]}"
+    if resp.status_code in RETRYABLE_STATUS:
+        raise httpx.HTTPStatusError(message, request=resp.request, response=resp)
+    raise RuntimeError(f"FMP API error: {message}")
+
+def _project(data: Any, fields: Optional[Sequence[str]]) -> Any:
+    """Trim each row of a decoded list response to `fields`."""
+    # Keeps cached rows small; the views only read these columns.
+    if not fields or not isinstance(data, list):
+        return data
+    return [
+        {name: row.get(name) for name in fields} if isinstance(row, dict) else row
+        for row in data
+    ]
+
 class FMPClient:
     """
     Thin wrapper over Financial Modeling Prep stable endpoints.
 
+    Symbols are passed through as given; callers normalise them.
+
     Base: https://financialmodelingprep.com/stable
     Examples:
       - /search-symbol?query=AAPL&apikey=...
       - /income-statement?symbol=AAPL&period=annual&limit=5&apikey=...
     """
 
-    def __init__(self, api_key: str = FMP_API_KEY, base_url: str = FMP_BASE_URL) -> None:
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        api_key: str = FMP_API_KEY,
+        base_url: str = FMP_BASE_URL,
+        cache: Optional[ResponseCache] = None,
+    ) -> None:
+        # Shared across requests so keep-alive connections are reused.
+        self._client = client
+        self._cache = cache or ResponseCache()
+        self._limiter = AsyncLimiter(max_rate=FMP_RATE_LIMIT, time_period=60)
+        self._sem = asyncio.Semaphore(FMP_MAX_CONCURRENCY)
+        # Upstream loads currently running, keyed like the cache.
+        self._inflight: Dict[str, asyncio.Future] = {}
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
+        self._urls = {name: f"{self.base_url}/{name}" for name in ENDPOINTS}
+        self._base_params = {"apikey": api_key}
 
-    def _get(self, endpoint: str, params: Optional[Dict[str, Any]] = None) -> Any:
+    @staticmethod
+    def _cache_key(endpoint: str, params: Dict[str, Any]) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+        return f"{endpoint.strip('/')}:{query}"
+
+    async def _get(
+        self,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        fields: Optional[Sequence[str]] = None,
+    ) -> Any:
         """
         endpoint: e.g. 'search-symbol', 'income-statement', 'profile'
+        fields: when given, each row of the decoded response is trimmed to
+        just these keys before it is cached (and FMP is asked for only
+        these when FMP_FIELDS_PUSHDOWN is on).
+
+        Served from the response cache when possible; a value past its
+        TTL but inside the stale-while-revalidate window is returned right
+        away while a refresh runs in the background. Concurrent misses
+        for the same key share a single upstream call. If FMP fails, the
+        last cached value is returned instead of the error when one exists.
+
+        The returned data may be shared with the cache and other callers,
+        so treat it as read-only.
         """
         if params is None:
             params = {}
-        params["apikey"] = self.api_key
+        if fields and FMP_FIELDS_PUSHDOWN:
+            params = {**params, "fields": ",".join(fields)}
+        key = self._cache_key(endpoint, params)
+        if fields and not FMP_FIELDS_PUSHDOWN:
+            key = f"{key}:{','.join(fields)}"
+
+        entry = await self._cache.get(key)
+        if entry is not None:
+            now = time.time()
+            if now < entry.fresh_until:
+                return entry.value
+            if now < entry.stale_until:
+                self._start_load(key, endpoint, params, fields)
+                return entry.value
+
+        # Shielded so one caller going away doesn't cancel it for the rest.
+        return await asyncio.shield(self._start_load(key, endpoint, params, fields))
+
+    def _start_load(
+        self,
+        key: str,
+        endpoint: str,
+        params: Dict[str, Any],
+        fields: Optional[Sequence[str]],
+    ) -> asyncio.Future:
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return inflight
+
+        inflight = asyncio.ensure_future(self._load(key, endpoint, params, fields))
+        self._inflight[key] = inflight
+
+        def _done(fut: asyncio.Future) -> None:
+            self._inflight.pop(key, None)
+            # Background refreshes have nobody awaiting them; mark the
+            # error as seen. Awaiting callers still get it raised.
+            if not fut.cancelled():
+                fut.exception()
 
-        url = f"{self.base_url}/{endpoint.lstrip('/')}"
-        resp = requests.get(url, params=params, timeout=10)
+        inflight.add_done_callback(_done)
+        return inflight
 
-        if not resp.ok:
-            raise RuntimeError(
-                f"FMP API error: {resp.status_code} {resp.text[:200]}"
-            )
-        return resp.json()
+    async def _load(
+        self,
+        key: str,
+        endpoint: str,
+        params: Dict[str, Any],
+        fields: Optional[Sequence[str]] = None,
+    ) -> Any:
+        try:
+            data = _project(await self._fetch(endpoint, params), fields)
+        except (RuntimeError, httpx.HTTPError) as exc:
+            stale = await self._cache.get(key)
+            if stale is not None:
+                return stale.value
+            if isinstance(exc, httpx.HTTPError):
+                # Retries exhausted on a transient failure.
+                raise RuntimeError(
+                    f"FMP API error: {str(exc) or type(exc).__name__}"
+                ) from exc
+            raise
+
+        await self._cache.set(key, data, CACHE_TTL.get(endpoint, CACHE_TTL_NORMAL))
+        return data
+
+    @_retry_transient
+    async def _fetch(self, endpoint: str, params: Dict[str, Any]) -> Any:
+        url = self._urls[endpoint]
+        async with self._sem, self._limiter:
+            resp = await self._client.get(url, params={**params, **self._base_params})
+
+        _raise_for_status(resp)
+        try:
+            data = orjson.loads(resp.content)
+        except orjson.JSONDecodeError:
+            raise RuntimeError(f"FMP API error: non-JSON body {resp.text[:200]!r}")
+        # Every endpoint we use answers with a list of rows; anything else
+        # (e.g. {"Error Message": "Limit Reach"} with a 200) is an error and
+        # must not be cached.
+        if not isinstance(data, list):
+            raise RuntimeError(f"FMP API error: {str(data)[:200]}")
+        return data
 
-    def search_symbol(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    async def search_symbol(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
         """
         https://financialmodelingprep.com/stable/search-symbol?query=...&limit=...&exchange=...
         """
-        return self._get(
+        return await self._get(
             "search-symbol",
             {
                 "query": query,
@@ -58,65 +253,77 @@ class FMPClient:
             },
         )
 
-    def get_company_profile(self, symbol: str) -> List[Dict[str, Any]]:
+    async def get_company_profile(self, symbol: str) -> List[Dict[str, Any]]:
         """
         https://financialmodelingprep.com/stable/profile?symbol=AAPL
         """
-        return self._get(
+        return await self._get(
             "profile",
-            {"symbol": symbol.upper()},
+            {"symbol": symbol},
         )
 
-    def get_income_statement(
+    async def get_income_statement(
         self,
         symbol: str,
         period: str = "annual",
         limit: int = 5,
+        fields: Optional[Sequence[str]] = None,
     ) -> List[Dict[str, Any]]:
         """
         https://financialmodelingprep.com/stable/income-statement?symbol=AAPL&period=annual&limit=5
+
+        Pass `fields` to get rows trimmed to those keys only.
         """
-        return self._get(
+        return await self._get(
             "income-statement",
             {
-                "symbol": symbol.upper(),
+                "symbol": symbol,
                 "period": period,
                 "limit": limit,
             },
+            fields=fields,
         )
 
-    def get_balance_sheet(
+    async def get_balance_sheet(
         self,
         symbol: str,
         period: str = "annual",
         limit: int = 5,
+        fields: Optional[Sequence[str]] = None,
     ) -> List[Dict[str, Any]]:
         """
         https://financialmodelingprep.com/stable/balance-sheet-statement?symbol=AAPL&period=annual&limit=5
+
+        Pass `fields` to get rows trimmed to those keys only.
         """
-        return self._get(
+        return await self._get(
             "balance-sheet-statement",
             {
-                "symbol": symbol.upper(),
+                "symbol": symbol,
                 "period": period,
                 "limit": limit,
             },
+            fields=fields,
         )
 
-    def get_cash_flow(
+    async def get_cash_flow(
         self,
         symbol: str,
         period: str = "annual",
         limit: int = 5,
+        fields: Optional[Sequence[str]] = None,
     ) -> List[Dict[str, Any]]:
         """
         https://financialmodelingprep.com/stable/cash-flow-statement?symbol=AAPL&period=annual&limit=5
+
+        Pass `fields` to get rows trimmed to those keys only.
         """
-        return self._get(
+        return await self._get(
             "cash-flow-statement",
             {
-                "symbol": symbol.upper(),
+                "symbol": symbol,
                 "period": period,
                 "limit": limit,
             },
+            fields=fields,
         )
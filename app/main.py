@@ -1,18 +1,38 @@
-from typing import List
-from fastapi import Depends, FastAPI, HTTPException, Query
-from fastapi.responses import JSONResponse
-from app.fmp_client import FMPClient
+import asyncio
+import hashlib
+import logging
+import re
+from typing import Annotated, Any, List, Optional
+import httpx
+import msgspec
+from brotli_asgi import BrotliMiddleware
+from fastapi import Body, Depends, FastAPI, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import MutableHeaders
+from redis.asyncio import Redis
+from app.cache import REDIS_URL, ResponseCache
+from app import structs
+from app.fmp_client import FMPClient, create_http_client
 from app.schemas import (
     CompanySearchItem,
     CompanySearchResponse,
     CompanySnapshot,
-    IncomeSnapshot,
-    BalanceSheetSnapshot,
-    CashFlowSnapshot,
-    HistoryPoint,
     CompanyHistoryResponse,
+    BatchSnapshotResponse,
 )
 
+# Upper bound on symbols per batch call, and on how many of them are
+# resolved against FMP at the same time.
+BATCH_MAX_SYMBOLS = 200
+BATCH_CONCURRENCY = 20
+
+HISTORY_CACHE_CONTROL = "public, max-age=86400"
+# The only statement columns each view reads; rows are trimmed to these.
+HISTORY_FIELDS = ("date", "revenue", "netIncome")
+SNAPSHOT_INCOME_FIELDS = ("date", "revenue", "revenueTTM", "netIncome", "netIncomeTTM")
+SNAPSHOT_BALANCE_FIELDS = ("date", "totalAssets", "totalLiabilities")
+SNAPSHOT_CASHFLOW_FIELDS = ("date", "operatingCashFlow", "operatingCashFlowTTM")
+
 app = FastAPI(
     title="Company Fundamentals Microservice",
     version="0.1.0",
@@ -22,11 +42,105 @@ app = FastAPI(
     ),
 )
 
+logger = logging.getLogger(__name__)
+
+class VaryAcceptEncodingMiddleware:
+    """
+    Make every response carry `Vary: Accept-Encoding` exactly once.
+
+    The compression middleware only adds it to responses it compresses, so
+    a shared cache could otherwise store an uncompressed variant as the
+    one answer for all encodings.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_vary(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if "accept-encoding" not in headers.get("vary", "").lower():
+                    headers.add_vary_header("Accept-Encoding")
+            await send(message)
+
+        await self.app(scope, receive, send_with_vary)
+
+# History and batch payloads are repetitive JSON; compress them for clients
+# that accept br (gzip otherwise). Quality 4 keeps per-request CPU low.
+app.add_middleware(BrotliMiddleware, quality=4, minimum_size=1024)
+# Added last so it wraps the compressor and sees its final headers.
+app.add_middleware(VaryAcceptEncodingMiddleware)
+
+http_client: Optional[httpx.AsyncClient] = None
+response_cache: Optional[ResponseCache] = None
+_client_singleton: Optional[FMPClient] = None
+
+@app.on_event("startup")
+async def open_clients() -> None:
+    global http_client, response_cache, _client_singleton
+    http_client = create_http_client()
+    # Caching is optional: without REDIS_URL every request goes to FMP.
+    response_cache = ResponseCache(Redis.from_url(REDIS_URL) if REDIS_URL else None)
+    _client_singleton = FMPClient(http_client, cache=response_cache)
+
+@app.on_event("shutdown")
+async def close_clients() -> None:
+    if http_client is not None:
+        await http_client.aclose()
+    if response_cache is not None:
+        await response_cache.close()
+
+def _as_float(value: Any) -> Optional[float]:
+    # FMP sends whole numbers as JSON ints; model_construct and msgspec
+    # structs won't coerce them.
+    return None if value is None else float(value)
+
+_encoder = msgspec.json.Encoder()
+
+def _json_response(obj: msgspec.Struct) -> Response:
+    # response_model stays on the routes for the OpenAPI docs; returning a
+    # Response directly means FastAPI skips validating/serializing it.
+    return Response(_encoder.encode(obj), media_type="application/json")
+
+def _etag(body: bytes) -> str:
+    # Weak: the same body may go out br, gzip or uncompressed, and a strong
+    # validator would have to differ per content-encoding.
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so ignore any W/ prefix.
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags or "*" in tags
+
+_SYMBOL_RE = re.compile(r"[A-Z0-9.\-]{1,10}")
+
+def _valid_symbol(symbol: str) -> str:
+    s = symbol.upper()
+    if not _SYMBOL_RE.fullmatch(s):
+        raise HTTPException(status_code=422, detail=f"Invalid symbol: {symbol!r}")
+    return s
+
+# Uppercased and validated once, before any upstream call.
+Symbol = Annotated[str, Depends(_valid_symbol)]
+
 def get_client() -> FMPClient:
-    return FMPClient()
+    # One client per process so every request shares the same connection
+    # pool and cache; kept behind Depends so tests can override it.
+    if _client_singleton is None:
+        raise RuntimeError(
+            "FMP client is not initialised; the app's startup handler has not run."
+        )
+    return _client_singleton
 
 @app.get("/health")
-def health_check() -> dict:
+async def health_check() -> dict:
     return {"status": "ok"}
 
 @app.get(
@@ -34,36 +148,102 @@ def health_check() -> dict:
     response_model=CompanySearchResponse,
     summary="Search for companies by name or symbol",
 )
-def search_companies(
+async def search_companies(
     q: str = Query(..., min_length=1, description="Search query"),
     limit: int = Query(10, ge=1, le=50),
     client: FMPClient = Depends(get_client),
 ):
-    raw = client.search_symbol(q, limit=limit)
-    results: List[CompanySearchItem] = []
-
-    for item in raw:
-        results.append(
-            CompanySearchItem(
-                symbol=item.get("symbol"),
-                name=item.get("name") or item.get("companyName"),
+    raw = await client.search_symbol(q, limit=limit)
+
+    # Rows come from our own mapping of FMP data, so skip per-field validation.
+    return CompanySearchResponse.model_construct(
+        results=[
+            CompanySearchItem.model_construct(
+                symbol=item["symbol"],
+                name=item.get("name") or item.get("companyName") or "",
                 exchange=item.get("stockExchange"),
                 currency=item.get("currency"),
             )
-        )
-
-    return CompanySearchResponse(results=results)
+            for item in raw
+            if item.get("symbol")
+        ]
+    )
 
 @app.get(
     "/companies/{symbol}/snapshot",
     response_model=CompanySnapshot,
     summary="Latest fundamentals snapshot for a given company",
 )
-def company_snapshot(
-    symbol: str,
+async def company_snapshot(
+    symbol: Symbol,
     client: FMPClient = Depends(get_client),
 ):
-    profiles = client.get_company_profile(symbol)
+    return _json_response(await _build_snapshot(symbol, client))
+
+@app.post(
+    "/companies/batch/snapshot",
+    response_model=BatchSnapshotResponse,
+    summary="Latest fundamentals snapshots for many companies in one call",
+)
+async def batch_snapshot(
+    symbols: List[str] = Body(..., min_length=1, max_length=BATCH_MAX_SYMBOLS),
+    client: FMPClient = Depends(get_client),
+):
+    # Validate each symbol on its own so one bad ticker doesn't fail the
+    # batch, then dedupe while keeping the caller's order.
+    errors: List[structs.BatchSnapshotError] = []
+    valid: List[str] = []
+    for raw in symbols:
+        try:
+            valid.append(_valid_symbol(raw))
+        except HTTPException as exc:
+            errors.append(structs.BatchSnapshotError(symbol=raw, detail=exc.detail))
+    unique = list(dict.fromkeys(valid))
+    sem = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(sym: str) -> structs.CompanySnapshot:
+        async with sem:
+            return await _build_snapshot(sym, client)
+
+    outcomes = await asyncio.gather(
+        *(one(s) for s in unique), return_exceptions=True
+    )
+
+    results: List[structs.CompanySnapshot] = []
+    for sym, outcome in zip(unique, outcomes):
+        if isinstance(outcome, HTTPException):
+            errors.append(structs.BatchSnapshotError(symbol=sym, detail=outcome.detail))
+        elif isinstance(outcome, RuntimeError):
+            errors.append(structs.BatchSnapshotError(symbol=sym, detail=str(outcome)))
+        elif isinstance(outcome, Exception):
+            # Unexpected data for this symbol only; don't fail the batch.
+            logger.error("Batch snapshot failed for %s", sym, exc_info=outcome)
+            errors.append(
+                structs.BatchSnapshotError(symbol=sym, detail="Failed to build snapshot")
+            )
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        else:
+            results.append(outcome)
+
+    return _json_response(
+        structs.BatchSnapshotResponse(results=results, errors=errors)
+    )
+
+async def _build_snapshot(symbol: str, client: FMPClient) -> structs.CompanySnapshot:
+    # Independent upstream calls: overlap them instead of paying four RTTs.
+    profiles, income_list, balance_list, cashflow_list = await asyncio.gather(
+        client.get_company_profile(symbol),
+        client.get_income_statement(
+            symbol, period="annual", limit=1, fields=SNAPSHOT_INCOME_FIELDS
+        ),
+        client.get_balance_sheet(
+            symbol, period="annual", limit=1, fields=SNAPSHOT_BALANCE_FIELDS
+        ),
+        client.get_cash_flow(
+            symbol, period="annual", limit=1, fields=SNAPSHOT_CASHFLOW_FIELDS
+        ),
+    )
     if not profiles:
         raise HTTPException(status_code=404, detail="Company profile not found")
 
@@ -72,10 +252,6 @@ def company_snapshot(
     currency = profile.get("currency")
     exchange = profile.get("exchangeShortName") or profile.get("exchange")
 
-    income_list = client.get_income_statement(symbol, period="annual", limit=1)
-    balance_list = client.get_balance_sheet(symbol, period="annual", limit=1)
-    cashflow_list = client.get_cash_flow(symbol, period="annual", limit=1)
-
     income_raw = income_list[0] if income_list else {}
     balance_raw = balance_list[0] if balance_list else {}
     cashflow_raw = cashflow_list[0] if cashflow_list else {}
@@ -86,23 +262,27 @@ def company_snapshot(
         or cashflow_raw.get("date")
     )
 
-    income = IncomeSnapshot(
-        revenue=income_raw.get("revenue") or income_raw.get("revenueTTM"),
-        netIncome=income_raw.get("netIncome") or income_raw.get("netIncomeTTM"),
+    income = structs.IncomeSnapshot(
+        revenue=_as_float(income_raw.get("revenue") or income_raw.get("revenueTTM")),
+        netIncome=_as_float(
+            income_raw.get("netIncome") or income_raw.get("netIncomeTTM")
+        ),
     )
 
-    balance = BalanceSheetSnapshot(
-        totalAssets=balance_raw.get("totalAssets"),
-        totalLiabilities=balance_raw.get("totalLiabilities"),
+    balance = structs.BalanceSheetSnapshot(
+        totalAssets=_as_float(balance_raw.get("totalAssets")),
+        totalLiabilities=_as_float(balance_raw.get("totalLiabilities")),
     )
 
-    cashflow = CashFlowSnapshot(
-        operatingCashFlow=cashflow_raw.get("operatingCashFlow")
-        or cashflow_raw.get("operatingCashFlowTTM")
+    cashflow = structs.CashFlowSnapshot(
+        operatingCashFlow=_as_float(
+            cashflow_raw.get("operatingCashFlow")
+            or cashflow_raw.get("operatingCashFlowTTM")
+        )
     )
 
-    snapshot = CompanySnapshot(
-        symbol=str(symbol).upper(),
+    return structs.CompanySnapshot(
+        symbol=symbol,
         name=name,
         currency=currency,
         exchange=exchange,
@@ -112,36 +292,41 @@ def company_snapshot(
         cashFlow=cashflow,
     )
 
-    return snapshot
-
 @app.get(
     "/companies/{symbol}/history",
     response_model=CompanyHistoryResponse,
     summary="Simple revenue/net income history for charting",
 )
-def company_history(
-    symbol: str,
+async def company_history(
+    request: Request,
+    symbol: Symbol,
     years: int = Query(5, ge=1, le=20),
     client: FMPClient = Depends(get_client),
 ):
-    income_list = client.get_income_statement(
-        symbol, period="annual", limit=years
+    income_list = await client.get_income_statement(
+        symbol, period="annual", limit=years, fields=HISTORY_FIELDS
     )
 
     if not income_list:
         raise HTTPException(status_code=404, detail="No income statement data found")
 
-    points: List[HistoryPoint] = []
-    for row in income_list:
-        points.append(
-            HistoryPoint(
-                date=row.get("date"),
-                revenue=row.get("revenue"),
-                netIncome=row.get("netIncome"),
-            )
+    points = [
+        structs.HistoryPoint(
+            date=row.get("date"),
+            revenue=_as_float(row.get("revenue")),
+            netIncome=_as_float(row.get("netIncome")),
         )
+        for row in income_list
+    ]
+    body = _encoder.encode(structs.CompanyHistoryResponse(symbol=symbol, points=points))
 
-    return CompanyHistoryResponse(symbol=str(symbol).upper(), points=points)
+    # Closed fiscal years don't change, so let browsers and CDNs keep this
+    # and revalidate with If-None-Match.
+    etag = _etag(body)
+    headers = {"ETag": etag, "Cache-Control": HISTORY_CACHE_CONTROL}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.exception_handler(RuntimeError)
 def runtime_error_handler(request, exc: RuntimeError):
@@ -46,3 +46,13 @@ class HistoryPoint(BaseModel):
 class CompanyHistoryResponse(BaseModel):
     symbol: str
     points: List[HistoryPoint]
+
+class BatchSnapshotError(BaseModel):
+    symbol: str
+    detail: str
+
+class BatchSnapshotResponse(BaseModel):
+    results: List[CompanySnapshot]
+    errors: List[BatchSnapshotError] = Field(
+        default_factory=list, description="Symbols that could not be resolved"
+    )
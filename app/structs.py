@@ -0,0 +1,46 @@
+from typing import List, Optional
+import msgspec
+
+# msgspec mirrors of the response models in app.schemas. The pydantic
+# models remain the documented contract (OpenAPI); handlers build these
+# and encode them directly, skipping pydantic on the hot paths. Keep the
+# two in sync.
+
+class IncomeSnapshot(msgspec.Struct, kw_only=True):
+    revenue: Optional[float] = None
+    netIncome: Optional[float] = None
+
+class BalanceSheetSnapshot(msgspec.Struct, kw_only=True):
+    totalAssets: Optional[float] = None
+    totalLiabilities: Optional[float] = None
+
+class CashFlowSnapshot(msgspec.Struct, kw_only=True):
+    operatingCashFlow: Optional[float] = None
+
+class CompanySnapshot(msgspec.Struct, kw_only=True):
+    symbol: str
+    name: Optional[str] = None
+    currency: Optional[str] = None
+    exchange: Optional[str] = None
+    asOf: Optional[str] = None
+
+    income: IncomeSnapshot
+    balanceSheet: BalanceSheetSnapshot
+    cashFlow: CashFlowSnapshot
+
+class HistoryPoint(msgspec.Struct, kw_only=True):
+    date: str
+    revenue: Optional[float] = None
+    netIncome: Optional[float] = None
+
+class CompanyHistoryResponse(msgspec.Struct, kw_only=True):
+    symbol: str
+    points: List[HistoryPoint]
+
+class BatchSnapshotError(msgspec.Struct, kw_only=True):
+    symbol: str
+    detail: str
+
+class BatchSnapshotResponse(msgspec.Struct, kw_only=True):
+    results: List[CompanySnapshot]
+    errors: List[BatchSnapshotError] = []